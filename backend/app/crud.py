@@ -3,10 +3,12 @@ CRUD operations for all database models using SQLModel.
 All functions accept an AsyncSession as the first parameter.
 """
 import json
-from datetime import datetime, date
+import orjson
+from datetime import datetime, date, timedelta
 from typing import List, Optional
 from uuid import uuid4
 from sqlmodel import select, delete
+from sqlalchemy import exists
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import selectinload
 
@@ -796,14 +798,14 @@ async def set_barcode_cache(
     existing = await get_barcode_cache(session, barcode)
     
     if existing:
-        existing.product_data = json.dumps(product_data)
+        existing.product_data = orjson.dumps(product_data).decode()
         existing.cached_at = datetime.utcnow()
         await session.flush()
         return existing
     
     cache = BarcodeCache(
         barcode=barcode,
-        product_data=json.dumps(product_data)
+        product_data=orjson.dumps(product_data).decode()
     )
     session.add(cache)
     await session.flush()
@@ -816,13 +818,13 @@ async def store_refresh_token(
     session: AsyncSession,
     jti: str,
     user_id: str,
-    expires_at: str
+    expires_at: int
 ) -> RefreshToken:
-    """Store a refresh token in the database"""
+    """Store a refresh token in the database (expires_at is epoch seconds)"""
     token = RefreshToken(
         jti=jti,
         user_id=user_id,
-        expires_at=datetime.fromisoformat(expires_at)
+        expires_at=datetime.utcfromtimestamp(expires_at)
     )
     session.add(token)
     await session.flush()
@@ -867,9 +869,9 @@ async def blacklist_token(
     session: AsyncSession,
     jti: str,
     token_type: str,
-    expires_at: str
+    expires_at: int
 ) -> BlacklistedToken:
-    """Add a token to the blacklist"""
+    """Add a token to the blacklist (expires_at is epoch seconds)"""
     # Check if already blacklisted
     statement = select(BlacklistedToken).where(BlacklistedToken.jti == jti)
     result = await session.execute(statement)
@@ -881,7 +883,7 @@ async def blacklist_token(
     token = BlacklistedToken(
         jti=jti,
         token_type=token_type,
-        expires_at=datetime.fromisoformat(expires_at)
+        expires_at=datetime.utcfromtimestamp(expires_at)
     )
     session.add(token)
     await session.flush()
@@ -898,6 +900,19 @@ async def is_token_blacklisted(
     return result.scalar_one_or_none() is not None
 
 
+async def get_user_if_token_valid(
+    session: AsyncSession,
+    user_id: str,
+    jti: Optional[str]
+) -> Optional[User]:
+    """Get user by ID unless the token's jti is blacklisted (one round-trip)"""
+    statement = select(User).where(User.id == user_id)
+    if jti:
+        statement = statement.where(~exists().where(BlacklistedToken.jti == jti))
+    result = await session.execute(statement)
+    return result.scalar_one_or_none()
+
+
 async def cleanup_expired_tokens(session: AsyncSession) -> None:
     """Remove expired tokens from refresh_tokens and blacklisted_tokens tables"""
     now = datetime.utcnow()
@@ -940,3 +955,13 @@ async def get_llm_usage(
     
     result = await session.execute(stmt)
     return list(result.scalars().all())
+
+
+async def delete_old_llm_usage(session: AsyncSession, keep_days: int = 30) -> int:
+    """Delete LLM usage records older than keep_days; returns the number removed"""
+    cutoff = date.today() - timedelta(days=keep_days)
+    result = await session.execute(
+        delete(LLMUsage).where(LLMUsage.date < cutoff)
+    )
+    await session.flush()
+    return result.rowcount
@@ -35,15 +35,21 @@ if os.getenv("DEBUG_DB", "false").lower() == "true":
     print(f"🔍 Database URL: {masked_url}")
     print(f"🔍 Schema: {SCHEMA_NAME}")
 
-# Create async engine with optimized settings for free tier
+# Create async engine with optimized settings for free tier.
+# Every request-scoped session (auth, barcode cache, rate limits) draws from this
+# pool; larger deployments can raise DB_POOL_SIZE / DB_MAX_OVERFLOW.
 engine = create_async_engine(
     DATABASE_URL,
     echo=os.getenv("SQL_ECHO", "false").lower() == "true",  # Log SQL queries if enabled
     future=True,
-    pool_size=2,  # Reduced from 5 to save memory on free tier
-    max_overflow=3,  # Reduced from 10 to save memory on free tier
+    pool_size=int(os.getenv("DB_POOL_SIZE", "2")),  # Default reduced from 5 to save memory on free tier
+    max_overflow=int(os.getenv("DB_MAX_OVERFLOW", "3")),  # Default reduced from 10 to save memory on free tier
     pool_timeout=30,  # Connection timeout in seconds
-    pool_recycle=3600,  # Recycle connections after 1 hour
+    pool_recycle=1800,  # Recycle connections after 30 minutes
+    pool_pre_ping=True,  # Replace connections dropped by the proxy/server before use
+    # asyncpg keeps prepared statements per connection; the hot auth/CRUD selects
+    # are all parameterized, so they are parsed and planned once and reused
+    connect_args={"prepared_statement_cache_size": 500},
 )
 
 # Create async session factory
@@ -2,7 +2,9 @@
 MainMeal API - AI-powered recipe adaptation for family dietary needs.
 FastAPI application with PostgreSQL backend using SQLModel.
 """
-from contextlib import asynccontextmanager
+import asyncio
+import logging
+from contextlib import asynccontextmanager, suppress
 from datetime import datetime, timezone
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
@@ -10,7 +12,10 @@ from dotenv import load_dotenv
 import os
 
 from app.routes import family, recipe, scan, pantry, auth, saved_recipes, shopping, meal_plan, barcode, rate_limit
-from app.database import init_db, close_db
+from app.database import init_db, close_db, async_session_maker
+from app import crud
+from app.services.ai_service import AIService
+from app.services.barcode_service import barcode_service
 from app.middleware.security import SecurityHeadersMiddleware
 from app.middleware.request_size import RequestSizeLimitMiddleware
 from app.middleware.error_handler import ErrorHandlerMiddleware
@@ -20,13 +25,42 @@ load_dotenv()
 APP_STARTED_AT = datetime.now(timezone.utc)
 
 
+logger = logging.getLogger(__name__)
+
+# Daily usage rows only matter for today's limits; keep a month for reporting
+LLM_USAGE_RETENTION_DAYS = 30
+LLM_USAGE_CLEANUP_INTERVAL_SECONDS = 24 * 3600
+
+
+async def prune_llm_usage_periodically():
+    """Delete old llm_usage rows once a day so the table and its indexes stay small"""
+    while True:
+        try:
+            async with async_session_maker() as session:
+                removed = await crud.delete_old_llm_usage(session, LLM_USAGE_RETENTION_DAYS)
+                await session.commit()
+            if removed:
+                logger.info(f"Pruned {removed} llm_usage rows older than {LLM_USAGE_RETENTION_DAYS} days")
+        except Exception:
+            logger.exception("llm_usage cleanup failed")
+        await asyncio.sleep(LLM_USAGE_CLEANUP_INTERVAL_SECONDS)
+
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """Application lifespan - startup and shutdown events"""
-    # Startup: Initialize database
+    # Startup: Initialize database and start background maintenance
     await init_db()
+    # One AIService per process, so its caches and Gemini concurrency cap are shared
+    app.state.ai_service = AIService()
+    cleanup_task = asyncio.create_task(prune_llm_usage_periodically())
     yield
-    # Shutdown: Close database connections
+    cleanup_task.cancel()
+    with suppress(asyncio.CancelledError):
+        await cleanup_task
+    # Shutdown: Close Gemini/Open Food Facts HTTP pools and database connections
+    await app.state.ai_service.aclose()
+    await barcode_service.aclose()
     await close_db()
 
 
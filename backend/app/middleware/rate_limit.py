@@ -4,6 +4,7 @@ Provides dependency functions for checking rate limits on AI endpoints.
 """
 import logging
 from datetime import datetime, timezone, timedelta
+from typing import AsyncIterator
 from fastapi import Depends, HTTPException, Response, status
 from sqlalchemy.ext.asyncio import AsyncSession
 
@@ -34,60 +35,74 @@ def check_ai_rate_limit(endpoint: str):
     Returns:
         Dependency function that:
         - Requires authentication
+        - Limits concurrent AI requests per user
         - Checks rate limit
         - Raises 429 if limit exceeded
-        - Returns user if allowed
+        - Yields user if allowed
     """
     async def rate_limit_check(
         response: Response,
         user: User = Depends(get_current_user_required),
         session: AsyncSession = Depends(get_session)
-    ) -> User:
+    ) -> AsyncIterator[User]:
         """
-        Check rate limit for the current user and endpoint.
+        Check rate limit for the current user and endpoint, holding one of the
+        user's concurrent-request slots until the request finishes.
         
         Raises:
-            HTTPException 429: If rate limit exceeded
+            HTTPException 429: If rate limit exceeded or too many requests in flight
         """
-        allowed, current_count, limit = await rate_limit_service.check_rate_limit(
-            session, user.id, endpoint
-        )
-        
-        # Calculate remaining calls
-        remaining = max(0, limit - current_count)
-        
-        # Calculate reset time (midnight UTC of next day)
-        now = datetime.now(timezone.utc)
-        tomorrow = (now + timedelta(days=1)).replace(hour=0, minute=0, second=0, microsecond=0)
-        reset_timestamp = int(tomorrow.timestamp())
-        
-        # Prepare rate limit headers
-        rate_limit_headers = {
-            "X-RateLimit-Limit": str(limit),
-            "X-RateLimit-Remaining": str(remaining),
-            "X-RateLimit-Reset": str(reset_timestamp)
-        }
-        
-        # Add rate limit headers to response (for successful requests)
-        response.headers.update(rate_limit_headers)
-        
-        if not allowed:
-            logger.warning(
-                f"Rate limit exceeded for user {user.id}, endpoint {endpoint}: "
-                f"{current_count}/{limit} calls used"
-            )
-            raise HTTPException(
-                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
-                detail={
-                    "error": "rate_limit_exceeded",
-                    "message": f"Daily limit of {limit} calls exceeded for {endpoint}",
-                    "current": current_count,
-                    "limit": limit,
-                    "reset_at": "midnight UTC"
-                },
-                headers=rate_limit_headers
+        async with rate_limit_service.acquire_slot(user.id) as acquired:
+            # Reject before counting, so refused parallel calls don't use daily quota
+            if not acquired:
+                raise HTTPException(
+                    status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                    detail={
+                        "error": "too_many_concurrent_requests",
+                        "message": "Too many AI requests in progress; wait for one to finish",
+                        "limit": rate_limit_service.max_concurrent
+                    }
+                )
+            
+            allowed, current_count, limit = await rate_limit_service.check_rate_limit(
+                session, user.id, endpoint
             )
-        
-        return user
+            
+            # Calculate remaining calls
+            remaining = max(0, limit - current_count)
+            
+            # Calculate reset time (midnight UTC of next day)
+            now = datetime.now(timezone.utc)
+            tomorrow = (now + timedelta(days=1)).replace(hour=0, minute=0, second=0, microsecond=0)
+            reset_timestamp = int(tomorrow.timestamp())
+            
+            # Prepare rate limit headers
+            rate_limit_headers = {
+                "X-RateLimit-Limit": str(limit),
+                "X-RateLimit-Remaining": str(remaining),
+                "X-RateLimit-Reset": str(reset_timestamp)
+            }
+            
+            # Add rate limit headers to response (for successful requests)
+            response.headers.update(rate_limit_headers)
+            
+            if not allowed:
+                logger.warning(
+                    f"Rate limit exceeded for user {user.id}, endpoint {endpoint}: "
+                    f"{current_count}/{limit} calls used"
+                )
+                raise HTTPException(
+                    status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                    detail={
+                        "error": "rate_limit_exceeded",
+                        "message": f"Daily limit of {limit} calls exceeded for {endpoint}",
+                        "current": current_count,
+                        "limit": limit,
+                        "reset_at": "midnight UTC"
+                    },
+                    headers=rate_limit_headers
+                )
+            
+            yield user
     
     return rate_limit_check
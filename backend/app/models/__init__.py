@@ -12,7 +12,11 @@ from app.models.family import (
 )
 from app.models.recipe import (
     VerdictType, Substitution, Adaptation, MemberVerdict, 
-    RecipeAnalysis, RecipeRequest
+    RecipeAnalysis, ScopedRecipeAnalysis, RecipeRequest
+)
+from app.models.ingredient import (
+    ConcernSeverity, Difficulty, IngredientConcern, IngredientAnalysis,
+    IngredientImageAnalysis, RecipeSuggestion, RecipeSuggestions
 )
 from app.models.saved_recipe import (
     SaveRecipeRequest, UpdateRecipeRequest, SavedRecipe,
@@ -21,7 +25,7 @@ from app.models.saved_recipe import (
 from app.models.shopping import (
     ShoppingItem, CreateShoppingListRequest, GenerateShoppingListRequest,
     AddItemRequest, UpdateItemRequest, ShoppingList, ShoppingListResponse,
-    ShoppingListsResponse, ExtractedIngredient
+    ShoppingListsResponse, ExtractedIngredient, RecipeIngredient, RecipeIngredientList
 )
 from app.models.meal_plan import (
     MealType, PlannedMeal, AddMealRequest, UpdateMealRequest,
@@ -55,14 +59,17 @@ __all__ = [
     "Role", "ConditionType", "HealthCondition", "FamilyMember", "FamilyProfile",
     # Recipe models
     "VerdictType", "Substitution", "Adaptation", "MemberVerdict",
-    "RecipeAnalysis", "RecipeRequest",
+    "RecipeAnalysis", "ScopedRecipeAnalysis", "RecipeRequest",
+    # Ingredient analysis models
+    "ConcernSeverity", "Difficulty", "IngredientConcern", "IngredientAnalysis",
+    "IngredientImageAnalysis", "RecipeSuggestion", "RecipeSuggestions",
     # Saved recipe models
     "SaveRecipeRequest", "UpdateRecipeRequest", "SavedRecipe",
     "SavedRecipeResponse", "SavedRecipesListResponse",
     # Shopping models
     "ShoppingItem", "CreateShoppingListRequest", "GenerateShoppingListRequest",
     "AddItemRequest", "UpdateItemRequest", "ShoppingList", "ShoppingListResponse",
-    "ShoppingListsResponse", "ExtractedIngredient",
+    "ShoppingListsResponse", "ExtractedIngredient", "RecipeIngredient", "RecipeIngredientList",
     # Meal plan models
     "MealType", "PlannedMeal", "AddMealRequest", "UpdateMealRequest",
     "MealPlan", "MealPlanResponse", "GenerateShoppingFromPlanRequest",
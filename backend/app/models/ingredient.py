@@ -0,0 +1,60 @@
+from enum import Enum
+from typing import List
+from pydantic import Field
+
+from app.models.ai_gate import GateDecision
+from app.models.recipe import OverallSafety, StrictModel
+
+
+class ConcernSeverity(str, Enum):
+    LOW = "low"
+    MEDIUM = "medium"
+    HIGH = "high"
+
+
+class Difficulty(str, Enum):
+    EASY = "easy"
+    MEDIUM = "medium"
+    HARD = "hard"
+
+
+class IngredientConcern(StrictModel):
+    ingredient: str
+    affected_members: List[str] = Field(default_factory=list)
+    reason: str
+    severity: ConcernSeverity
+
+
+class IngredientAnalysis(StrictModel):
+    scope: GateDecision = Field(exclude=True)
+    overall_safety: OverallSafety
+    concerns: List[IngredientConcern] = Field(default_factory=list)
+    safe_for_all: List[str] = Field(default_factory=list)
+    recommendations: List[str] = Field(default_factory=list)
+
+
+class IngredientImageAnalysis(StrictModel):
+    scope: GateDecision = Field(exclude=True)
+    product_name: str
+    extracted_ingredients: List[str] = Field(default_factory=list)
+    overall_safety: OverallSafety
+    concerns: List[IngredientConcern] = Field(default_factory=list)
+    safe_for_all: List[str] = Field(default_factory=list)
+    recommendations: List[str] = Field(default_factory=list)
+
+
+class RecipeSuggestion(StrictModel):
+    name: str
+    description: str
+    difficulty: Difficulty
+    prep_time: str
+    matching_ingredients: List[str] = Field(default_factory=list)
+    additional_ingredients: List[str] = Field(default_factory=list)
+    safety_notes: str
+    family_friendly_score: int = Field(ge=1, le=5)
+
+
+class RecipeSuggestions(StrictModel):
+    scope: GateDecision = Field(exclude=True)
+    suggestions: List[RecipeSuggestion]
+    tips: List[str] = Field(default_factory=list)
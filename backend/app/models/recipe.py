@@ -2,6 +2,8 @@ from enum import Enum
 from typing import List, Optional
 from pydantic import BaseModel, Field, ConfigDict, model_validator
 
+from app.models.ai_gate import GateDecision
+
 
 class OverallSafety(str, Enum):
     SAFE = "safe"
@@ -51,6 +53,10 @@ class MemberVerdict(StrictModel):
         return self
 
 
+class ScopedOutput(StrictModel):
+    scope: GateDecision = Field(exclude=True)
+
+
 class RecipeAnalysis(StrictModel):
     dish_name: str
     base_description: str
@@ -59,6 +65,10 @@ class RecipeAnalysis(StrictModel):
     general_tips: List[str] = Field(default_factory=list)
 
 
+class ScopedRecipeAnalysis(RecipeAnalysis, ScopedOutput):
+    """Generation schema: the scope decision comes first and is never serialized."""
+
+
 class RecipeRequest(StrictModel):
     recipe_text: str
     family_profile: dict
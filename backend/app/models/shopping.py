@@ -3,6 +3,8 @@ from typing import List, Optional
 from datetime import datetime
 import uuid
 
+from app.models.ai_gate import GateDecision
+
 
 class ShoppingItem(BaseModel):
     """An item in a shopping list"""
@@ -69,3 +71,17 @@ class ExtractedIngredient(BaseModel):
     ingredient: str
     quantity: str
     category: str
+
+
+class RecipeIngredient(BaseModel):
+    """An ingredient of a single recipe, with a numeric quantity for merging"""
+    ingredient: str
+    quantity: Optional[float] = None
+    unit: str = ""
+    category: str
+
+
+class RecipeIngredientList(BaseModel):
+    """Ingredients extracted from one recipe"""
+    scope: GateDecision = Field(exclude=True)
+    ingredients: List[RecipeIngredient]
@@ -9,9 +9,10 @@ from typing import Optional, List, TYPE_CHECKING
 from enum import Enum
 from uuid import uuid4
 from sqlmodel import SQLModel, Field, Relationship
-from sqlalchemy import UniqueConstraint
+from sqlalchemy import UniqueConstraint, func
 from dotenv import load_dotenv
 import json
+import orjson
 
 load_dotenv()
 
@@ -308,7 +309,7 @@ class BarcodeCache(SQLModel, table=True):
     
     def get_product_data(self) -> dict:
         """Parse product_data JSON to dict"""
-        return json.loads(self.product_data)
+        return orjson.loads(self.product_data)
     
     def set_product_data(self, data: dict):
         """Serialize dict to JSON"""
@@ -357,8 +358,14 @@ class LLMUsage(SQLModel, table=True):
     endpoint: str = Field(index=True)
     date: DateType = Field(default_factory=lambda: date.today(), index=True)
     call_count: int = Field(default=0)
-    created_at: Optional[datetime] = Field(default_factory=datetime.utcnow)
-    updated_at: Optional[datetime] = Field(default_factory=datetime.utcnow)
+    created_at: Optional[datetime] = Field(
+        default_factory=datetime.utcnow,
+        sa_column_kwargs={"server_default": func.now()}
+    )
+    updated_at: Optional[datetime] = Field(
+        default_factory=datetime.utcnow,
+        sa_column_kwargs={"server_default": func.now(), "onupdate": func.now()}
+    )
     
     # Relationships
     user: "User" = Relationship(back_populates="llm_usage")
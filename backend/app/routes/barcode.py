@@ -7,7 +7,7 @@ from typing import Optional, List
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.services.barcode_service import barcode_service
-from app.services.ai_service import ai_service, AIBlocked, AIOutOfScope, AIInvalidOutput
+from app.services.ai_service import AIService, get_ai_service, AIBlocked, AIOutOfScope, AIInvalidOutput
 from app.middleware.auth import get_current_user
 from app.middleware.rate_limit import check_ai_rate_limit
 from app.models.user import User
@@ -98,7 +98,8 @@ async def analyze_barcode(
     barcode: str,
     family_profile: dict,
     user: User = Depends(check_ai_rate_limit("analyze_ingredients")),
-    session: AsyncSession = Depends(get_session)
+    session: AsyncSession = Depends(get_session),
+    ai_service: AIService = Depends(get_ai_service)
 ):
     """Analyze a product's ingredients against family profile"""
     # Get product info
@@ -143,7 +144,7 @@ async def analyze_barcode(
     
     try:
         # Use AI to analyze ingredients
-        analysis = ai_service.analyze_ingredients(ingredients, family_profile)
+        analysis = await ai_service.analyze_ingredients(ingredients, family_profile)
         
         return BarcodeAnalysisResponse(
             product=BarcodeProductResponse(
@@ -16,7 +16,7 @@ from app.models.meal_plan import (
 )
 from app.models.shopping import ShoppingListResponse, ShoppingItem
 from app import crud
-from app.services.ai_service import ai_service, AIBlocked, AIOutOfScope, AIInvalidOutput
+from app.services.ai_service import AIService, get_ai_service, AIBlocked, AIOutOfScope, AIInvalidOutput
 from app.middleware.auth import get_current_user
 from app.middleware.rate_limit import check_ai_rate_limit
 from app.models.user import User
@@ -155,7 +155,8 @@ async def generate_shopping_from_plan(
     plan_id: str,
     request: GenerateShoppingFromPlanRequest,
     user: User = Depends(check_ai_rate_limit("extract_ingredients_from_recipes")),
-    session: AsyncSession = Depends(get_session)
+    session: AsyncSession = Depends(get_session),
+    ai_service: AIService = Depends(get_ai_service)
 ):
     """Generate a shopping list from all recipes in the meal plan"""
     # Get all recipes from the plan
@@ -166,7 +167,7 @@ async def generate_shopping_from_plan(
     
     try:
         # Use AI to extract and combine ingredients
-        extracted_ingredients = ai_service.extract_ingredients_from_recipes([
+        extracted_ingredients = await ai_service.extract_ingredients_from_recipes([
             {"dish_name": r.dish_name, "recipe_text": r.recipe_text or ""}
             for r in recipes
         ])
@@ -7,7 +7,7 @@ from typing import List, Optional
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app import crud
-from app.services.ai_service import ai_service, AIBlocked, AIOutOfScope, AIInvalidOutput
+from app.services.ai_service import AIService, get_ai_service, AIBlocked, AIOutOfScope, AIInvalidOutput
 from app.models.user import User
 from app.models.family import FamilyMember, HealthCondition
 from app.middleware.auth import get_current_user
@@ -113,7 +113,8 @@ async def clear_pantry(
 @router.post("/suggest-recipes")
 async def suggest_recipes(
     user: User = Depends(check_ai_rate_limit("suggest_recipes_from_ingredients")),
-    session: AsyncSession = Depends(get_session)
+    session: AsyncSession = Depends(get_session),
+    ai_service: AIService = Depends(get_ai_service)
 ):
     """Suggest recipes based on pantry ingredients and family profile"""
     # Get pantry items
@@ -131,7 +132,7 @@ async def suggest_recipes(
     family_profile = {"members": [member_to_dict(m) for m in members]}
     
     try:
-        result = ai_service.suggest_recipes_from_ingredients(
+        result = await ai_service.suggest_recipes_from_ingredients(
             ingredients=ingredients,
             family_profile=family_profile
         )
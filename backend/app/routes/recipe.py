@@ -3,7 +3,7 @@ from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.models.recipe import RecipeRequest, RecipeAnalysis
 from app.models.user import User
-from app.services.ai_service import ai_service, AIBlocked, AIOutOfScope, AIInvalidOutput
+from app.services.ai_service import AIService, get_ai_service, AIBlocked, AIOutOfScope, AIInvalidOutput
 from app.middleware.rate_limit import check_ai_rate_limit
 from app.database import get_session
 
@@ -14,11 +14,12 @@ router = APIRouter()
 async def analyze_recipe(
     request: RecipeRequest,
     user: User = Depends(check_ai_rate_limit("analyze_recipe")),
-    session: AsyncSession = Depends(get_session)
+    session: AsyncSession = Depends(get_session),
+    ai_service: AIService = Depends(get_ai_service)
 ):
     """Analyze a recipe against family dietary needs"""
     try:
-        analysis = ai_service.analyze_recipe(
+        analysis = await ai_service.analyze_recipe(
             recipe_text=request.recipe_text,
             family_profile=request.family_profile
         )
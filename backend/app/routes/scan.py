@@ -6,7 +6,7 @@ from fastapi import APIRouter, UploadFile, File, HTTPException, Depends
 from typing import Optional
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.services.ai_service import ai_service, AIBlocked, AIOutOfScope, AIInvalidOutput
+from app.services.ai_service import AIService, get_ai_service, AIBlocked, AIOutOfScope, AIInvalidOutput
 from app import crud
 from app.models.family import FamilyProfile
 from app.models.user import User
@@ -56,7 +56,8 @@ ALLOWED_EXTENSIONS = [".jpg", ".jpeg", ".png", ".webp"]
 async def analyze_ingredient_label(
     file: UploadFile = File(...),
     user: User = Depends(check_ai_rate_limit("analyze_ingredient_image")),
-    session: AsyncSession = Depends(get_session)
+    session: AsyncSession = Depends(get_session),
+    ai_service: AIService = Depends(get_ai_service)
 ):
     """
     Analyze an ingredient label image for family safety
@@ -105,7 +106,7 @@ async def analyze_ingredient_label(
             )
         
         # Analyze with Gemini Vision
-        result = ai_service.analyze_ingredient_image(
+        result = await ai_service.analyze_ingredient_image(
             image_data=image_data,
             family_profile=family_profile,
             mime_type=file.content_type or "image/jpeg"
@@ -16,7 +16,7 @@ from app.models.shopping import (
     ShoppingListsResponse
 )
 from app import crud
-from app.services.ai_service import ai_service, AIBlocked, AIInvalidOutput, AIOutOfScope
+from app.services.ai_service import AIService, get_ai_service, AIBlocked, AIInvalidOutput, AIOutOfScope
 from app.middleware.auth import get_current_user
 from app.middleware.rate_limit import check_ai_rate_limit
 from app.models.user import User
@@ -112,7 +112,8 @@ async def create_list(
 async def generate_list_from_recipes(
     request: GenerateShoppingListRequest,
     user: User = Depends(check_ai_rate_limit("extract_ingredients_from_recipes")),
-    session: AsyncSession = Depends(get_session)
+    session: AsyncSession = Depends(get_session),
+    ai_service: AIService = Depends(get_ai_service)
 ):
     """Generate a shopping list from saved recipes using AI"""
     # Fetch all recipes
@@ -131,7 +132,7 @@ async def generate_list_from_recipes(
     
     try:
         # Use AI to extract ingredients
-        extracted_ingredients = ai_service.extract_ingredients_from_recipes(recipes)
+        extracted_ingredients = await ai_service.extract_ingredients_from_recipes(recipes)
         
         # Create shopping list
         list_id = str(uuid.uuid4())
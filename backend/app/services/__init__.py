@@ -1,3 +1,3 @@
-from .ai_service import ai_service
+from .ai_service import get_ai_service
 
-__all__ = ["ai_service"]
+__all__ = ["get_ai_service"]
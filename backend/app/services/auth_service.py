@@ -3,12 +3,21 @@ Authentication service with JWT token management.
 Updated to work with SQLModel and async sessions.
 """
 import os
+import re
+import time
+import secrets
+import asyncio
 import uuid
-from datetime import datetime, timedelta
+import binascii
+import hashlib
+import hmac
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
 from typing import Optional, Tuple
 
 import bcrypt
-from jose import JWTError, jwt
+import orjson
+from cachetools import TTLCache
 from dotenv import load_dotenv
 from sqlalchemy.ext.asyncio import AsyncSession
 
@@ -16,6 +25,11 @@ from app.models.user import UserCreate, User, Token, TokenData, TokenPair
 from app.models.tables import User as UserModel
 from app import crud
 
+try:
+    import pybase64 as base64
+except ImportError:  # pybase64 is optional; the stdlib codec is API-compatible, just slower
+    import base64
+
 load_dotenv()
 
 # Configuration
@@ -25,57 +39,138 @@ if not SECRET_KEY:
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_HOURS = 1  # Short-lived access tokens
 REFRESH_TOKEN_EXPIRE_DAYS = 7  # Longer-lived refresh tokens
+BCRYPT_ROUNDS = 12  # bcrypt cost factor (2^12 iterations)
+
+# bcrypt releases the GIL, so hashes run in parallel here instead of blocking the event loop
+_bcrypt_executor = ThreadPoolExecutor(max_workers=os.cpu_count(), thread_name_prefix="bcrypt")
+
+
+# Hot-path callables are bound as default args so each call is a local lookup
+
+def _b64url_encode(data: bytes, _encode=base64.urlsafe_b64encode) -> bytes:
+    return _encode(data).rstrip(b"=")
+
+
+def _b64url_decode(data: bytes, _decode=base64.urlsafe_b64decode) -> bytes:
+    return _decode(data + b"=" * (-len(data) % 4))
+
+
+# The header never changes; encode it once
+_JWT_HEADER_B64 = _b64url_encode(orjson.dumps({"alg": ALGORITHM, "typ": "JWT"}))
+
+# Token claims have a fixed shape; hex/uuid ids need no JSON escaping, so they are
+# formatted straight into these templates instead of building and dumping a dict
+_ACCESS_PAYLOAD_TEMPLATE = b'{"sub":"%s","exp":%d,"iat":%d,"jti":"%s","type":"access"}'
+_REFRESH_PAYLOAD_TEMPLATE = b'{"sub":"%s","exp":%d,"iat":%d,"jti":"%s","type":"refresh"}'
+_TEMPLATE_SAFE_ID = re.compile(r"[0-9a-f-]+").fullmatch
+
+
+def _token_payload(template: bytes, user_id: str, exp: int, iat: int, jti: str, token_type: str) -> bytes:
+    """Serialize token claims, via the fixed-shape template when the ids need no escaping"""
+    if _TEMPLATE_SAFE_ID(user_id) and _TEMPLATE_SAFE_ID(jti):
+        return template % (user_id.encode("ascii"), exp, iat, jti.encode("ascii"))
+    return orjson.dumps({"sub": user_id, "exp": exp, "iat": iat, "jti": jti, "type": token_type})
 
 
 class AuthService:
+    __slots__ = (
+        "secret_key", "algorithm", "access_token_expire", "refresh_token_expire",
+        "access_token_expire_seconds", "refresh_token_expire_seconds",
+        "secret_key_bytes", "bcrypt_rounds", "_revoked_jtis", "_token_cache",
+    )
+
     def __init__(self):
         self.secret_key = SECRET_KEY
         self.algorithm = ALGORITHM
         self.access_token_expire = timedelta(hours=ACCESS_TOKEN_EXPIRE_HOURS)
         self.refresh_token_expire = timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS)
+        self.access_token_expire_seconds = int(self.access_token_expire.total_seconds())
+        self.refresh_token_expire_seconds = int(self.refresh_token_expire.total_seconds())
+        self.secret_key_bytes = SECRET_KEY.encode("utf-8")
+        self.bcrypt_rounds = BCRYPT_ROUNDS
+        # jti -> True for access tokens revoked by this worker; entries outlive the token itself
+        self._revoked_jtis = TTLCache(maxsize=10_000, ttl=self.access_token_expire.total_seconds())
+        # token string -> (TokenData, exp); skips HMAC + JSON for tokens seen before
+        self._token_cache = TTLCache(maxsize=10_000, ttl=self.access_token_expire.total_seconds())
+
+    def _encode_jwt(self, payload_json: bytes, *, _hmac_new=hmac.new, _sha256=hashlib.sha256) -> str:
+        """Sign a serialized claims object as an HS256 JWT (HMAC-SHA256 via hashlib/OpenSSL)"""
+        signing_input = _JWT_HEADER_B64 + b"." + _b64url_encode(payload_json)
+        signature = _hmac_new(self.secret_key_bytes, signing_input, _sha256).digest()
+        return (signing_input + b"." + _b64url_encode(signature)).decode("ascii")
+
+    def _decode_jwt(
+        self,
+        token: str,
+        *,
+        _hmac_new=hmac.new,
+        _sha256=hashlib.sha256,
+        _compare_digest=hmac.compare_digest,
+        _loads=orjson.loads,
+        _time=time.time,
+    ) -> Optional[dict]:
+        """Verify an HS256 JWT's signature, algorithm and expiry; returns its claims or None"""
+        try:
+            header_b64, payload_b64, signature_b64 = token.encode("ascii").split(b".")
+            signature = _b64url_decode(signature_b64)
+        except (UnicodeEncodeError, ValueError, binascii.Error):
+            return None
+
+        expected = _hmac_new(self.secret_key_bytes, header_b64 + b"." + payload_b64, _sha256).digest()
+        if not _compare_digest(expected, signature):
+            return None
+
+        try:
+            if header_b64 != _JWT_HEADER_B64:
+                header = _loads(_b64url_decode(header_b64))
+                if not isinstance(header, dict) or header.get("alg") != self.algorithm:
+                    return None
+            payload = _loads(_b64url_decode(payload_b64))
+        except (ValueError, binascii.Error):
+            return None
+
+        if not isinstance(payload, dict):
+            return None
+        exp = payload.get("exp")
+        if not isinstance(exp, (int, float)) or exp <= _time():
+            return None
+        return payload
     
-    def verify_password(self, plain_password: str, hashed_password: str) -> bool:
+    async def verify_password(self, plain_password: str, hashed_password: str) -> bool:
         """Verify a plain password against a hashed password"""
-        # Truncate to 72 bytes (bcrypt limit)
-        password_bytes = plain_password.encode('utf-8')[:72]
-        return bcrypt.checkpw(password_bytes, hashed_password.encode('utf-8'))
+        # Truncate to 72 bytes (bcrypt limit); slicing the str first bounds the encode work
+        password_bytes = plain_password[:72].encode('utf-8')[:72]
+        return await asyncio.get_running_loop().run_in_executor(
+            _bcrypt_executor, bcrypt.checkpw, password_bytes, hashed_password.encode('utf-8')
+        )
     
-    def hash_password(self, password: str) -> str:
+    async def hash_password(self, password: str) -> str:
         """Hash a password (truncated to 72 bytes for bcrypt)"""
-        # Truncate to 72 bytes (bcrypt limit)
-        password_bytes = password.encode('utf-8')[:72]
-        salt = bcrypt.gensalt()
-        return bcrypt.hashpw(password_bytes, salt).decode('utf-8')
+        # Truncate to 72 bytes (bcrypt limit); slicing the str first bounds the encode work
+        password_bytes = password[:72].encode('utf-8')[:72]
+        salt = bcrypt.gensalt(self.bcrypt_rounds)
+        hashed = await asyncio.get_running_loop().run_in_executor(
+            _bcrypt_executor, bcrypt.hashpw, password_bytes, salt
+        )
+        return hashed.decode('utf-8')
     
     def create_access_token(self, user_id: str) -> Tuple[str, str]:
         """Create a JWT access token. Returns (token, jti)"""
-        jti = str(uuid.uuid4())
-        expire = datetime.utcnow() + self.access_token_expire
-        to_encode = {
-            "sub": user_id,
-            "exp": expire,
-            "iat": datetime.utcnow(),
-            "jti": jti,
-            "type": "access"
-        }
-        encoded_jwt = jwt.encode(to_encode, self.secret_key, algorithm=self.algorithm)
+        jti = secrets.token_hex(16)
+        now = int(time.time())
+        expire = now + self.access_token_expire_seconds
+        encoded_jwt = self._encode_jwt(_token_payload(_ACCESS_PAYLOAD_TEMPLATE, user_id, expire, now, jti, "access"))
         return encoded_jwt, jti
     
     async def create_refresh_token(self, session: AsyncSession, user_id: str) -> Tuple[str, str]:
         """Create a JWT refresh token and store it in DB. Returns (token, jti)"""
-        jti = str(uuid.uuid4())
-        expire = datetime.utcnow() + self.refresh_token_expire
-        to_encode = {
-            "sub": user_id,
-            "exp": expire,
-            "iat": datetime.utcnow(),
-            "jti": jti,
-            "type": "refresh"
-        }
-        encoded_jwt = jwt.encode(to_encode, self.secret_key, algorithm=self.algorithm)
+        jti = secrets.token_hex(16)
+        now = int(time.time())
+        expire = now + self.refresh_token_expire_seconds
+        encoded_jwt = self._encode_jwt(_token_payload(_REFRESH_PAYLOAD_TEMPLATE, user_id, expire, now, jti, "refresh"))
         
         # Store refresh token in database
-        await crud.store_refresh_token(session, jti, user_id, expire.isoformat())
+        await crud.store_refresh_token(session, jti, user_id, expire)
         
         return encoded_jwt, jti
     
@@ -91,51 +186,45 @@ class AuthService:
         }
     
     def decode_token(self, token: str, expected_type: str = "access") -> Optional[TokenData]:
-        """Decode and validate a JWT token"""
-        try:
-            payload = jwt.decode(token, self.secret_key, algorithms=[self.algorithm])
+        """Decode and validate a JWT token (verified tokens are cached until they expire)"""
+        cached = self._token_cache.get(token)
+        if cached is not None:
+            token_data, exp = cached
+            if exp <= time.time():
+                self._token_cache.pop(token, None)
+                return None
+        else:
+            payload = self._decode_jwt(token)
+            if payload is None:
+                return None
+
             user_id: str = payload.get("sub")
             jti: str = payload.get("jti")
             token_type: str = payload.get("type", "access")
             
             if user_id is None:
                 return None
-            
-            # Verify token type matches expected
-            if token_type != expected_type:
-                return None
-            
-            return TokenData(user_id=user_id, jti=jti, token_type=token_type)
-        except JWTError:
-            return None
-    
-    async def decode_and_validate_token(
-        self,
-        session: AsyncSession,
-        token: str,
-        expected_type: str = "access"
-    ) -> Optional[TokenData]:
-        """Decode token and check if it's blacklisted"""
-        token_data = self.decode_token(token, expected_type)
-        if token_data is None:
-            return None
+
+            token_data = TokenData(user_id=user_id, jti=jti, token_type=token_type)
+            self._token_cache[token] = (token_data, payload["exp"])
         
-        # Check if token is blacklisted
-        if token_data.jti and await crud.is_token_blacklisted(session, token_data.jti):
+        # Verify token type matches expected
+        if token_data.token_type != expected_type:
             return None
         
         return token_data
     
     async def register_user(self, session: AsyncSession, user_data: UserCreate) -> dict:
         """Register a new user"""
-        # Check if email already exists
+        # Check if email already exists (before hashing, so duplicate sign-ups
+        # can't be used to burn bcrypt CPU)
         existing_user = await crud.get_user_by_email(session, user_data.email)
         if existing_user:
             raise ValueError("Email already registered")
         
         # Create user
         user_id = str(uuid.uuid4())
-        password_hash = self.hash_password(user_data.password)
+        password_hash = await self.hash_password(user_data.password)
         
         user = await crud.create_user(
             session,
@@ -166,7 +255,7 @@ class AuthService:
         if not user:
             return None
         
-        if not self.verify_password(password, user.password_hash):
+        if not await self.verify_password(password, user.password_hash):
             return None
         
         # Generate token pair
@@ -187,11 +276,14 @@ class AuthService:
     
     async def get_current_user(self, session: AsyncSession, token: str) -> Optional[User]:
         """Get the current user from an access token"""
-        token_data = await self.decode_and_validate_token(session, token, expected_type="access")
+        token_data = self.decode_token(token, expected_type="access")
         if token_data is None or token_data.user_id is None:
             return None
+        if token_data.jti in self._revoked_jtis:
+            return None
         
-        user = await crud.get_user_by_id(session, token_data.user_id)
+        # Blacklist check and user fetch in a single query
+        user = await crud.get_user_if_token_valid(session, token_data.user_id, token_data.jti)
         if user is None:
             return None
         
@@ -208,8 +300,8 @@ class AuthService:
         Refresh tokens using a valid refresh token.
         Implements token rotation - old refresh token is invalidated.
         """
-        # Decode and validate the refresh token
-        token_data = await self.decode_and_validate_token(session, refresh_token, expected_type="refresh")
+        # Decode the refresh token
+        token_data = self.decode_token(refresh_token, expected_type="refresh")
         if token_data is None or token_data.user_id is None or token_data.jti is None:
             return None
         
@@ -218,8 +310,8 @@ class AuthService:
         if stored_token is None:
             return None
         
-        # Get user to ensure they still exist
-        user = await crud.get_user_by_id(session, token_data.user_id)
+        # Get user to ensure they still exist and the token isn't blacklisted
+        user = await crud.get_user_if_token_valid(session, token_data.user_id, token_data.jti)
         if user is None:
             return None
         
@@ -257,15 +349,14 @@ class AuthService:
         
         if token_data and token_data.jti:
             # Get expiry from token for blacklist cleanup
-            try:
-                payload = jwt.decode(access_token, self.secret_key, algorithms=[self.algorithm])
-                exp = payload.get("exp")
-                if exp:
-                    expire_dt = datetime.utcfromtimestamp(exp)
-                    await crud.blacklist_token(session, token_data.jti, "access", expire_dt.isoformat())
-            except JWTError:
-                pass
+            payload = self._decode_jwt(access_token)
+            exp = payload.get("exp") if payload else None
+            if exp:
+                await crud.blacklist_token(session, token_data.jti, "access", int(exp))
+                self._revoked_jtis[token_data.jti] = True
         
+        self._token_cache.pop(access_token, None)
+
         # Delete all refresh tokens for this user
         await crud.delete_user_refresh_tokens(session, user_id)
         
@@ -309,10 +400,10 @@ class AuthService:
         if not user:
             return False
         
-        if not self.verify_password(current_password, user.password_hash):
+        if not await self.verify_password(current_password, user.password_hash):
             raise ValueError("Current password is incorrect")
         
-        new_hash = self.hash_password(new_password)
+        new_hash = await self.hash_password(new_password)
         await crud.update_user(session, user_id, password_hash=new_hash)
         return True
     
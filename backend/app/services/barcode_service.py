@@ -2,18 +2,104 @@
 Barcode lookup service using Open Food Facts API.
 Updated to work with SQLModel and async sessions.
 """
+import asyncio
+import logging
 import httpx
-from typing import Optional
+import orjson
+from datetime import datetime, timedelta
+from typing import Dict, Optional
+from cachetools import TTLCache
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app import crud
 
+logger = logging.getLogger(__name__)
+
+# Keep-alive pool for Open Food Facts so cache misses reuse one TLS session
+_OFF_POOL_LIMITS = httpx.Limits(max_connections=100, max_keepalive_connections=20)
+_OFF_CONNECT_RETRIES = 2
+# Repeat scans within a worker skip the DB cache round-trip
+_PRODUCT_CACHE_SIZE = 4096
+_PRODUCT_CACHE_TTL_SECONDS = 3600
+# Barcodes OFF doesn't know are remembered too (as a marker row), for a day
+_NOT_FOUND_TTL = timedelta(days=1)
+_NOT_FOUND_DATA = {"not_found": True}
+_NOT_FOUND = object()  # in-process marker for a remembered miss
+_LEADER_CANCELLED = object()  # in-flight lookup was cancelled before it finished
+
+
+def _build_product_info(barcode: str, product: dict) -> dict:
+    """Map an Open Food Facts product record to the cached product_info shape"""
+    get = product.get
+    nutr = get("nutriments") or {}
+    nutr_get = nutr.get
+    categories = get("categories")
+    ingredients = get("ingredients")
+    return {
+        "barcode": barcode,
+        "name": get("product_name") or get("product_name_en") or "Unknown Product",
+        "brand": get("brands", "Unknown Brand"),
+        "quantity": get("quantity", ""),
+        "categories": categories.split(",") if categories else [],
+        "ingredients_text": get("ingredients_text") or get("ingredients_text_en") or "",
+        "ingredients_list": [text for ing in ingredients if (text := ing.get("text"))] if ingredients else [],
+        "allergens": get("allergens_tags", []),
+        "allergens_text": get("allergens", ""),
+        "nutrition": {
+            "energy_kcal": nutr_get("energy-kcal_100g"),
+            "fat": nutr_get("fat_100g"),
+            "saturated_fat": nutr_get("saturated-fat_100g"),
+            "carbohydrates": nutr_get("carbohydrates_100g"),
+            "sugars": nutr_get("sugars_100g"),
+            "fiber": nutr_get("fiber_100g"),
+            "proteins": nutr_get("proteins_100g"),
+            "salt": nutr_get("salt_100g"),
+            "sodium": nutr_get("sodium_100g"),
+        },
+        "nutriscore": get("nutriscore_grade"),
+        "nova_group": get("nova_group"),
+        "image_url": get("image_front_url") or get("image_url"),
+        "image_small_url": get("image_front_small_url"),
+    }
+
 
 class BarcodeService:
     """Service for looking up product information by barcode"""
     
     OPEN_FOOD_FACTS_URL = "https://world.openfoodfacts.org/api/v2/product"
     
+    def __init__(self):
+        self._client: Optional[httpx.AsyncClient] = None
+        # barcode -> product_info, in front of the BarcodeCache table
+        self._product_cache: TTLCache = TTLCache(maxsize=_PRODUCT_CACHE_SIZE, ttl=_PRODUCT_CACHE_TTL_SECONDS)
+        # barcode -> pending lookup; concurrent misses for one barcode share it
+        self._inflight: Dict[str, asyncio.Future] = {}
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        """Open Food Facts client, created on first use rather than at import."""
+        if self._client is None:
+            # The transport retries failed connection attempts (with backoff)
+            # before a transient network blip turns into "product not found"
+            self._client = httpx.AsyncClient(
+                base_url=self.OPEN_FOOD_FACTS_URL,
+                timeout=10.0,
+                transport=httpx.AsyncHTTPTransport(
+                    http2=True,
+                    limits=_OFF_POOL_LIMITS,
+                    retries=_OFF_CONNECT_RETRIES,
+                ),
+            )
+        return self._client
+
+    async def aclose(self) -> None:
+        """Release pooled Open Food Facts connections (called on app shutdown)."""
+        client = self._client
+        if client is None:
+            return
+        self._client = None
+        await client.aclose()
+
     async def lookup_product(
         self,
         session: AsyncSession,
@@ -23,68 +109,94 @@ class BarcodeService:
         Look up a product by barcode using Open Food Facts API.
         Results are cached in the database to reduce API calls.
         """
-        # Check cache first
+        while True:
+            # Check in-process cache first
+            product_info = self._product_cache.get(barcode)
+            if product_info is not None:
+                return None if product_info is _NOT_FOUND else product_info
+            
+            # Join a lookup already in flight for this barcode rather than repeating it
+            pending = self._inflight.get(barcode)
+            if pending is None:
+                break
+            product_info = await asyncio.shield(pending)
+            if product_info is not _LEADER_CANCELLED:
+                return product_info
+            # The lookup we joined was cancelled; start over (possibly as leader)
+        
+        pending = asyncio.get_running_loop().create_future()
+        self._inflight[barcode] = pending
+        try:
+            product_info = await self._load_product(session, barcode)
+        except asyncio.CancelledError:
+            pending.set_result(_LEADER_CANCELLED)
+            raise
+        except BaseException as exc:
+            # Waiters get the leader's error, not a "not found"
+            pending.set_exception(exc)
+            pending.exception()  # retrieved here too, so no waiters is not an "unretrieved" warning
+            raise
+        else:
+            pending.set_result(product_info)
+        finally:
+            self._inflight.pop(barcode, None)
+        return product_info
+    
+    async def _load_product(
+        self,
+        session: AsyncSession,
+        barcode: str
+    ) -> Optional[dict]:
+        """Database cache, then Open Food Facts (caching the result in both layers)"""
         cached = await crud.get_barcode_cache(session, barcode)
         if cached:
-            return cached.get_product_data()
+            product_info = cached.get_product_data()
+            if not product_info.get("not_found"):
+                self._product_cache[barcode] = product_info
+                return product_info
+            if cached.cached_at and datetime.utcnow() - cached.cached_at < _NOT_FOUND_TTL:
+                self._product_cache[barcode] = _NOT_FOUND
+                return None
+            # Expired miss: ask Open Food Facts again
         
         # Fetch from Open Food Facts
         try:
-            async with httpx.AsyncClient(timeout=10.0) as client:
-                response = await client.get(
-                    f"{self.OPEN_FOOD_FACTS_URL}/{barcode}.json"
-                )
-                
-                if response.status_code != 200:
-                    return None
-                
-                data = response.json()
-                
-                if data.get("status") != 1:
-                    return None
-                
-                product = data.get("product", {})
-                
-                # Extract relevant information
-                product_info = {
-                    "barcode": barcode,
-                    "name": product.get("product_name") or product.get("product_name_en") or "Unknown Product",
-                    "brand": product.get("brands", "Unknown Brand"),
-                    "quantity": product.get("quantity", ""),
-                    "categories": product.get("categories", "").split(",") if product.get("categories") else [],
-                    "ingredients_text": product.get("ingredients_text") or product.get("ingredients_text_en") or "",
-                    "ingredients_list": [
-                        ing.get("text", "") 
-                        for ing in product.get("ingredients", [])
-                        if ing.get("text")
-                    ],
-                    "allergens": product.get("allergens_tags", []),
-                    "allergens_text": product.get("allergens", ""),
-                    "nutrition": {
-                        "energy_kcal": product.get("nutriments", {}).get("energy-kcal_100g"),
-                        "fat": product.get("nutriments", {}).get("fat_100g"),
-                        "saturated_fat": product.get("nutriments", {}).get("saturated-fat_100g"),
-                        "carbohydrates": product.get("nutriments", {}).get("carbohydrates_100g"),
-                        "sugars": product.get("nutriments", {}).get("sugars_100g"),
-                        "fiber": product.get("nutriments", {}).get("fiber_100g"),
-                        "proteins": product.get("nutriments", {}).get("proteins_100g"),
-                        "salt": product.get("nutriments", {}).get("salt_100g"),
-                        "sodium": product.get("nutriments", {}).get("sodium_100g"),
-                    },
-                    "nutriscore": product.get("nutriscore_grade"),
-                    "nova_group": product.get("nova_group"),
-                    "image_url": product.get("image_front_url") or product.get("image_url"),
-                    "image_small_url": product.get("image_front_small_url"),
-                }
-                
-                # Cache the result
-                await crud.set_barcode_cache(session, barcode, product_info)
-                
-                return product_info
-                
-        except Exception as e:
-            print(f"Error fetching barcode {barcode}: {e}")
+            response = await self.client.get(f"/{barcode}.json")
+            
+            # Unknown product: remember the miss without parsing the body
+            if response.status_code in (404, 410):
+                await self._remember_not_found(session, barcode)
+                return None
+            if response.status_code != 200:
+                return None
+            
+            data = orjson.loads(response.content)
+            
+            if not isinstance(data, dict):
+                return None
+            if data.get("status") != 1:
+                await self._remember_not_found(session, barcode)
+                return None
+            
+            product_info = _build_product_info(barcode, data.get("product") or {})
+            
+            # Cache the result
+            await crud.set_barcode_cache(session, barcode, product_info)
+            self._product_cache[barcode] = product_info
+            
+            return product_info
+            
+        except httpx.HTTPError:
+            logger.warning("Open Food Facts request failed for %s", barcode, exc_info=True)
             return None
+        except orjson.JSONDecodeError:
+            logger.warning("Open Food Facts returned invalid JSON for %s", barcode)
+            return None
+    
+    async def _remember_not_found(self, session: AsyncSession, barcode: str) -> None:
+        """Cache a marker so unknown barcodes don't re-hit Open Food Facts"""
+        await crud.set_barcode_cache(session, barcode, _NOT_FOUND_DATA)
+        self._product_cache[barcode] = _NOT_FOUND
 
 
 # Singleton instance
@@ -3,45 +3,58 @@ Rate limiting service for LLM API calls.
 Tracks usage per user per endpoint per day and enforces configurable limits.
 """
 import os
-from datetime import date, datetime
-from typing import Tuple, Dict, Optional
+from contextlib import asynccontextmanager
+from types import MappingProxyType
+from datetime import date
+from typing import AsyncIterator, Final, Mapping, Tuple, Dict, Optional
+from sqlalchemy import func, lambda_stmt
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlmodel import select
+from cachetools import TTLCache
 
 from app.models.tables import LLMUsage
 from dotenv import load_dotenv
 
 load_dotenv()
 
+# /usage is polled by the UI; serve repeat polls from memory for a couple of seconds
+_USAGE_STATS_CACHE_SIZE = 10_000
+_USAGE_STATS_CACHE_TTL_SECONDS = 2
+
+# Map endpoint names to environment variable names
+_ENV_VAR_MAP: Final[Mapping[str, str]] = MappingProxyType({
+    "analyze_recipe": "LLM_LIMIT_ANALYZE_RECIPE",
+    "analyze_ingredient_image": "LLM_LIMIT_ANALYZE_INGREDIENT_IMAGE",
+    "suggest_recipes_from_ingredients": "LLM_LIMIT_SUGGEST_RECIPES",
+    "extract_ingredients_from_recipes": "LLM_LIMIT_EXTRACT_INGREDIENTS",
+    "analyze_ingredients": "LLM_LIMIT_ANALYZE_INGREDIENTS",
+})
+
 
 class RateLimitService:
     """Service for managing rate limits on LLM API calls"""
     
     # Default limits (can be overridden by environment variables)
-    DEFAULT_LIMITS = {
+    DEFAULT_LIMITS: Final[Mapping[str, int]] = MappingProxyType({
         "analyze_recipe": 50,
         "analyze_ingredient_image": 30,
         "suggest_recipes_from_ingredients": 20,
         "extract_ingredients_from_recipes": 30,
         "analyze_ingredients": 40,
-    }
+    })
+    # Limit for endpoints without a configured entry
+    DEFAULT_LIMIT = 10
+    # In-flight AI requests allowed per user at once (across endpoints)
+    DEFAULT_MAX_CONCURRENT = 3
     
     def __init__(self):
         """Initialize rate limit service with configurable limits from environment"""
         self.daily_limits = {}
         
-        # Map endpoint names to environment variable names
-        env_var_map = {
-            "analyze_recipe": "LLM_LIMIT_ANALYZE_RECIPE",
-            "analyze_ingredient_image": "LLM_LIMIT_ANALYZE_INGREDIENT_IMAGE",
-            "suggest_recipes_from_ingredients": "LLM_LIMIT_SUGGEST_RECIPES",
-            "extract_ingredients_from_recipes": "LLM_LIMIT_EXTRACT_INGREDIENTS",
-            "analyze_ingredients": "LLM_LIMIT_ANALYZE_INGREDIENTS",
-        }
-        
         # Load limits from environment variables, fallback to defaults
         for endpoint, default_limit in self.DEFAULT_LIMITS.items():
-            env_var_name = env_var_map.get(endpoint, f"LLM_LIMIT_{endpoint.upper()}")
+            env_var_name = _ENV_VAR_MAP.get(endpoint, f"LLM_LIMIT_{endpoint.upper()}")
             limit = os.getenv(env_var_name)
             if limit:
                 try:
@@ -51,6 +64,19 @@ class RateLimitService:
                     self.daily_limits[endpoint] = default_limit
             else:
                 self.daily_limits[endpoint] = default_limit
+        
+        # Limits are fixed after startup; freeze them and pre-bind the lookup
+        self.daily_limits = MappingProxyType(self.daily_limits)
+        self._limit_get = self.daily_limits.get
+        # (user_id, endpoint or "*") -> stats dict from get_usage_stats
+        self._stats_cache = TTLCache(maxsize=_USAGE_STATS_CACHE_SIZE, ttl=_USAGE_STATS_CACHE_TTL_SECONDS)
+        
+        try:
+            self.max_concurrent = int(os.getenv("LLM_MAX_CONCURRENT_PER_USER", self.DEFAULT_MAX_CONCURRENT))
+        except ValueError:
+            self.max_concurrent = self.DEFAULT_MAX_CONCURRENT
+        # user_id -> AI requests currently in flight on this worker
+        self._active_requests: Dict[str, int] = {}
     
     async def check_rate_limit(
         self,
@@ -72,40 +98,63 @@ class RateLimitService:
         if user_id is None:
             raise ValueError("user_id is required for rate limiting")
         
-        limit = self.daily_limits.get(endpoint, 10)  # Default 10 if endpoint not configured
+        limit = self._limit_get(endpoint, self.DEFAULT_LIMIT)
         today = date.today()
         
-        # Get or create usage record
-        stmt = select(LLMUsage).where(
-            LLMUsage.user_id == user_id,
-            LLMUsage.endpoint == endpoint,
-            LLMUsage.date == today
-        )
-        result = await session.execute(stmt)
-        usage = result.scalar_one_or_none()
-        
-        if usage is None:
-            # First call today - create new record
-            usage = LLMUsage(
+        # Create or increment today's record in one atomic statement; the
+        # conditional update leaves an exhausted counter alone and returns no row
+        stmt = (
+            pg_insert(LLMUsage)
+            .values(
                 user_id=user_id,
                 endpoint=endpoint,
                 date=today,
-                call_count=1
+                call_count=1,
+                created_at=func.now(),
+                updated_at=func.now()
+            )
+            .on_conflict_do_update(
+                index_elements=["user_id", "endpoint", "date"],
+                set_={"call_count": LLMUsage.call_count + 1, "updated_at": func.now()},
+                where=LLMUsage.call_count < limit
             )
-            session.add(usage)
-            await session.flush()
-            return (True, 1, limit)
+            .returning(LLMUsage.call_count)
+        )
+        result = await session.execute(stmt)
+        call_count = result.scalar_one_or_none()
         
-        # Check if limit exceeded
-        if usage.call_count >= limit:
-            return (False, usage.call_count, limit)
+        if call_count is None:
+            # Limit already reached (the counter never exceeds it)
+            return (False, limit, limit)
         
-        # Increment count
-        usage.call_count += 1
-        usage.updated_at = datetime.utcnow()
-        await session.flush()
+        # Counts changed; drop this user's cached stats
+        self._stats_cache.pop((user_id, "*"), None)
+        self._stats_cache.pop((user_id, endpoint), None)
         
-        return (True, usage.call_count, limit)
+        return (True, call_count, limit)
+    
+    @asynccontextmanager
+    async def acquire_slot(self, user_id: str) -> AsyncIterator[bool]:
+        """
+        Hold one of the user's concurrent AI request slots for the duration of the block.
+        
+        Yields False (holding nothing) when the user already has max_concurrent
+        requests in flight, so callers can reject instead of queueing.
+        """
+        active = self._active_requests.get(user_id, 0)
+        if active >= self.max_concurrent:
+            yield False
+            return
+        
+        self._active_requests[user_id] = active + 1
+        try:
+            yield True
+        finally:
+            remaining = self._active_requests[user_id] - 1
+            if remaining:
+                self._active_requests[user_id] = remaining
+            else:
+                del self._active_requests[user_id]
     
     async def get_usage_stats(
         self,
@@ -131,37 +180,44 @@ class RateLimitService:
                 }
             }
         """
+        cache_key = (user_id, endpoint or "*")
+        cached = self._stats_cache.get(cache_key)
+        if cached is not None:
+            return cached
+        
         today = date.today()
-        stmt = select(LLMUsage).where(
+        # Only the two columns we report; no ORM row hydration. As a lambda
+        # statement the query is built and cache-keyed once, then re-bound per call.
+        stmt = lambda_stmt(lambda: select(LLMUsage.endpoint, LLMUsage.call_count).where(
             LLMUsage.user_id == user_id,
             LLMUsage.date == today
-        )
+        ))
         if endpoint:
-            stmt = stmt.where(LLMUsage.endpoint == endpoint)
+            stmt += lambda s: s.where(LLMUsage.endpoint == endpoint)
         
         result = await session.execute(stmt)
-        usages = result.scalars().all()
         
         stats = {}
         
         # Add stats for existing usage records
-        for usage in usages:
-            limit = self.daily_limits.get(usage.endpoint, 10)
-            stats[usage.endpoint] = {
-                "calls": usage.call_count,
+        for usage_endpoint, call_count in result:
+            limit = self._limit_get(usage_endpoint, self.DEFAULT_LIMIT)
+            stats[usage_endpoint] = {
+                "calls": call_count,
                 "limit": limit,
-                "remaining": max(0, limit - usage.call_count)
+                "remaining": max(0, limit - call_count)
             }
         
         # If filtering by specific endpoint and no record exists, return zero stats
         if endpoint and endpoint not in stats:
-            limit = self.daily_limits.get(endpoint, 10)
+            limit = self._limit_get(endpoint, self.DEFAULT_LIMIT)
             stats[endpoint] = {
                 "calls": 0,
                 "limit": limit,
                 "remaining": limit
             }
         
+        self._stats_cache[cache_key] = stats
         return stats
 
 
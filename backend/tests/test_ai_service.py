@@ -0,0 +1,61 @@
+import asyncio
+
+import pytest
+
+from app.services.ai_service import AIInvalidOutput, AIOutOfScope, AIService
+
+
+def test_analyze_ingredient_image_raises_out_of_scope(monkeypatch):
+    async def _generate_json_text(self, *, contents, config):
+        return '{"scope": "OUT_OF_SCOPE"}'
+
+    monkeypatch.setattr(AIService, "_generate_json_text", _generate_json_text)
+
+    with pytest.raises(AIOutOfScope):
+        asyncio.run(AIService().analyze_ingredient_image(b"not a label", {"members": []}, mime_type="image/png"))
+
+
+def test_extract_ingredients_cancels_sibling_chunks_on_failure(monkeypatch):
+    cancelled = []
+
+    async def _extract_recipe_ingredients(self, recipe_blocks):
+        if recipe_blocks[0].startswith("Recipe 0"):
+            raise AIInvalidOutput("bad chunk")
+        try:
+            await asyncio.sleep(60)
+        except asyncio.CancelledError:
+            cancelled.append(recipe_blocks[0])
+            raise
+
+    async def _run():
+        recipes = [{"dish_name": f"Recipe {i}", "recipe_text": "soup"} for i in range(5)]
+        with pytest.raises(AIInvalidOutput):
+            await AIService().extract_ingredients_from_recipes(recipes)
+        await asyncio.sleep(0)
+        # Checked before asyncio.run() tears down leftover tasks
+        assert cancelled == ["Recipe 4\nsoup"]
+
+    monkeypatch.setattr(AIService, "_extract_recipe_ingredients", _extract_recipe_ingredients)
+    asyncio.run(_run())
+
+
+def test_cached_analysis_misses_when_the_family_profile_changes(monkeypatch):
+    calls = []
+
+    async def _generate_json_text(self, *, contents, config):
+        calls.append(contents)
+        return '{"scope": "ALLOW", "overall_safety": "safe"}'
+
+    monkeypatch.setattr(AIService, "_generate_json_text", _generate_json_text)
+    service = AIService()
+    before = {"members": [{"name": "Sam", "conditions": []}]}
+    after = {"members": [{"name": "Sam", "conditions": [{"type": "diabetes", "enabled": True}]}]}
+
+    async def _run():
+        await service.analyze_ingredients(["sugar"], before)
+        await service.analyze_ingredients(["sugar"], before)
+        await service.analyze_ingredients(["sugar"], after)
+
+    asyncio.run(_run())
+
+    assert len(calls) == 2
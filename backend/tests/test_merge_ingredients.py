@@ -0,0 +1,61 @@
+from app.services.ai_service import _merge_ingredients, _normalize_unit
+
+
+def _quantities(items):
+    return {item["ingredient"]: item["quantity"] for item in _merge_ingredients(items)}
+
+
+def test_normalize_unit_maps_aliases_and_plurals():
+    assert _normalize_unit("Tbsp.") == "tbsp"
+    assert _normalize_unit("tablespoons") == "tbsp"
+    assert _normalize_unit("Cups") == "cup"
+    assert _normalize_unit("lbs") == "lb"
+    assert _normalize_unit("cloves") == "clove"
+    assert _normalize_unit("leaves") == "leaf"
+    assert _normalize_unit("bus") == "bus"
+    assert _normalize_unit("glass") == "glass"
+
+
+def test_merge_combines_plural_and_singular_counts():
+    assert _quantities(
+        [
+            {"ingredient": "Garlic", "quantity": 2, "unit": "cloves", "category": "produce"},
+            {"ingredient": "garlic", "quantity": 1, "unit": "clove", "category": "produce"},
+            {"ingredient": "Tomatoes", "quantity": 1, "unit": "can", "category": "pantry"},
+            {"ingredient": "tomatoes", "quantity": 2, "unit": "cans", "category": "pantry"},
+        ]
+    ) == {"Garlic": "3 cloves", "Tomatoes": "3 cans"}
+
+
+def test_merge_keeps_a_shared_unit_across_spellings():
+    assert _quantities(
+        [
+            {"ingredient": "Olive oil", "quantity": 1, "unit": "Tbsp.", "category": "pantry"},
+            {"ingredient": "olive oil", "quantity": 1, "unit": "tablespoons", "category": "pantry"},
+            {"ingredient": "Flour", "quantity": 1, "unit": "cup", "category": "pantry"},
+            {"ingredient": "flour", "quantity": 1, "unit": "Cups", "category": "pantry"},
+        ]
+    ) == {"Olive oil": "2 tbsp", "Flour": "2 cups"}
+
+
+def test_merge_sums_mixed_units_in_the_largest_one():
+    assert _quantities(
+        [
+            {"ingredient": "Milk", "quantity": 1, "unit": "cup", "category": "dairy"},
+            {"ingredient": "milk", "quantity": 8, "unit": "tbsp", "category": "dairy"},
+            {"ingredient": "Beef", "quantity": 500, "unit": "g", "category": "meat"},
+            {"ingredient": "beef", "quantity": 1, "unit": "kg", "category": "meat"},
+        ]
+    ) == {"Milk": "1.5 cups", "Beef": "1.5 kg"}
+
+
+def test_merge_keeps_quantities_it_cannot_parse():
+    assert _quantities(
+        [
+            {"ingredient": "Salt", "quantity": 1, "unit": "tsp", "category": "pantry"},
+            {"ingredient": "salt", "quantity": None, "unit": "", "category": "pantry"},
+            {"ingredient": "Basil", "quantity": 2, "unit": "sprigs", "category": "produce"},
+            {"ingredient": "basil", "quantity": None, "unit": "handful", "category": "produce"},
+            {"ingredient": "Pepper", "quantity": None, "unit": "", "category": "pantry"},
+        ]
+    ) == {"Salt": "1 tsp + as needed", "Basil": "2 sprigs + handful", "Pepper": None}
@@ -0,0 +1,73 @@
+import orjson
+import pytest
+from fastapi.testclient import TestClient
+
+from app.database import get_session
+from app.main import app
+from app.models.user import User
+from app.routes import recipe
+from app.services.ai_service import AIService, get_ai_service
+
+
+ANALYSIS = {
+    "scope": "ALLOW",
+    "dish_name": "Tomato soup",
+    "base_description": "A simple tomato soup.",
+    "overall_safety": "safe",
+    "member_verdicts": [
+        {
+            "member_id": "m1",
+            "member_name": "Sam",
+            "verdict": "safe",
+            "reasons": ["No restricted ingredients."],
+        }
+    ],
+    "general_tips": [],
+}
+
+
+async def _no_session():
+    yield None
+
+
+@pytest.fixture
+def client():
+    route = next(r for r in recipe.router.routes if r.path == "/analyze")
+    rate_limit_check = next(d.call for d in route.dependant.dependencies if d.call.__name__ == "rate_limit_check")
+    service = AIService()
+    app.dependency_overrides[rate_limit_check] = lambda: User(id="u1", email="sam@example.com", name="Sam")
+    app.dependency_overrides[get_session] = _no_session
+    app.dependency_overrides[get_ai_service] = lambda: service
+    yield TestClient(app)
+    app.dependency_overrides.clear()
+
+
+def _respond_with(payload):
+    async def _generate_json_text(self, *, contents, config):
+        return orjson.dumps(payload).decode()
+    return _generate_json_text
+
+
+def test_analyze_returns_analysis_without_scope(client, monkeypatch):
+    monkeypatch.setattr(AIService, "_generate_json_text", _respond_with(ANALYSIS))
+
+    response = client.post("/api/recipe/analyze", json={"recipe_text": "Tomato soup", "family_profile": {}})
+
+    assert response.status_code == 200
+    body = response.json()
+    assert "scope" not in body
+    assert body["dish_name"] == "Tomato soup"
+
+
+def test_analyze_reports_out_of_scope(client, monkeypatch):
+    monkeypatch.setattr(AIService, "_generate_json_text", _respond_with({"scope": "OUT_OF_SCOPE"}))
+
+    response = client.post("/api/recipe/analyze", json={"recipe_text": "Write me a poem", "family_profile": {}})
+
+    assert response.status_code == 400
+    assert response.json()["detail"]["error"] == "out_of_scope"
+
+
+def test_analyze_openapi_does_not_require_scope():
+    schema = app.openapi()["components"]["schemas"]["RecipeAnalysis"]
+    assert "scope" not in schema["properties"]